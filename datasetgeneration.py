@@ -3,24 +3,55 @@
 # OpenRouter API Version
 # ===========================================
 
+import hashlib
 import json
+import mmap
 import os
 import random
 import re
+import subprocess
 import sys
+import threading
 import time
 import requests
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
+
+try:
+    import orjson  # Optional: C-level JSON parsing/serialization (several times faster than json)
+except ImportError:
+    orjson = None
+try:
+    import msgspec  # Optional: typed JSON decoding that validates dialogues while parsing
+except ImportError:
+    msgspec = None
 
 # ===========================================
 # CONFIG
 # ===========================================
-# Model configuration - OpenRouter API only
+# Generation mode:
+# - "live" (default): concurrent OpenRouter chat completion calls
+# - "batch": OpenAI Batch API - offline, ~50% cheaper and no rate-limit contention,
+#   results within 24h. OpenRouter has no batch endpoint, so this needs OPENAI_API_KEY.
+GENERATION_MODE = os.getenv("GENERATION_MODE", "live").lower()
+if GENERATION_MODE not in ["live", "batch"]:
+    raise ValueError(f"Invalid generation mode: {GENERATION_MODE}. Must be one of: live, batch")
+
+# Model configuration - OpenRouter API (live mode)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-if not OPENROUTER_API_KEY:
+if GENERATION_MODE == "live" and not OPENROUTER_API_KEY:
     raise ValueError("OPENROUTER_API_KEY environment variable is required!")
 
+# Model configuration - OpenAI Batch API (batch mode)
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+if GENERATION_MODE == "batch" and not OPENAI_API_KEY:
+    raise ValueError("OPENAI_API_KEY environment variable is required for GENERATION_MODE=batch!")
+
 # Available GPT-5.1 models on OpenRouter:
 # - "openai/gpt-5.1" (default) - Best for general tasks, 400K context, $1.25/$10 per M tokens
 # - "openai/gpt-5.1-chat" - Fast, lightweight for chat (128K context)
@@ -29,25 +60,92 @@ if not OPENROUTER_API_KEY:
 # - "openai/gpt-5.1-codex-mini" - Smaller, faster coding model
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openai/gpt-5.1")  # Default: GPT-5.1
 
+# Batch mode calls OpenAI directly, so the OpenRouter "openai/" prefix is dropped
+OPENAI_BATCH_MODEL = os.getenv("OPENAI_BATCH_MODEL", OPENROUTER_MODEL.split("/", 1)[-1])
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "60"))
+
 OUTPUT_DIR = "/home/vaneet_2221cs15/legal-data/legalbot/hindi_posco_dataset"
 CASE_SUMMARY_FILE = "/home/vaneet_2221cs15/legal-data/legalbot/formatted_case_passages.txt"
 
+# On-disk cache of model responses keyed by a hash of (model, prompt), so re-running the
+# pipeline does not pay for the same generations again. Set RESPONSE_CACHE=0 to force
+# regeneration (the cache is then neither read nor written).
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_DIR = f"{OUTPUT_DIR}/.cache"
+
 # ===========================================
 # LANGUAGE SELECTION (for single-language runs)
 # ===========================================
 # Set this to generate only one language at a time
-# Options: "hindi", "english", "code_mixed"
+# Options: "hindi", "english", "code_mixed", or "all" (one child process per language, in parallel)
 # Can also be set via environment variable: GENERATE_LANGUAGE
 CURRENT_LANGUAGE = os.getenv("GENERATE_LANGUAGE", "code_mixed").lower()  # Default: code_mixed
+ALL_LANGUAGES = ["hindi", "english", "code_mixed"]
 
 # Validate language
-if CURRENT_LANGUAGE not in ["hindi", "english", "code_mixed"]:
-    raise ValueError(f"Invalid language: {CURRENT_LANGUAGE}. Must be one of: hindi, english, code_mixed")
+if CURRENT_LANGUAGE not in ALL_LANGUAGES + ["all"]:
+    raise ValueError(f"Invalid language: {CURRENT_LANGUAGE}. Must be one of: hindi, english, code_mixed, all")
 
 SAMPLES_PER_LANGUAGE = 400  # 400 dialogs per language
 TARGET_SAMPLES = SAMPLES_PER_LANGUAGE  # For single language run
 LANGUAGES = [CURRENT_LANGUAGE]  # Only process the selected language
 
+# Number of dialogues generated concurrently (requests in flight to OpenRouter)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "32"))
+# Planned dialogues submitted to the pool at any time; the rest wait in the plan until a slot frees up
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", str(2 * MAX_CONCURRENT_REQUESTS)))
+# Dialogues requested per API call (live mode); >1 shares one request and one system-prompt
+# prefill between dialogues of the same complexity, each still on its own case
+DIALOGUES_PER_CALL = max(1, int(os.getenv("DIALOGUES_PER_CALL", "1")))
+# Dialogues appended to the output file between flushes (at most this many are lost if the process is killed)
+JSONL_FLUSH_EVERY = max(1, int(os.getenv("JSONL_FLUSH_EVERY", "16")))
+# Seed for the generation plan (case order, turn counts, shuffle). Fixed by default so an
+# interrupted run rebuilds the same plan (same dialogue IDs) and only generates what is missing.
+GENERATION_SEED = int(os.getenv("GENERATION_SEED", "0"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# OpenRouter rate budget (requests and tokens per minute), reserved before each call
+OPENROUTER_RPM = int(os.getenv("OPENROUTER_RPM", "300"))
+OPENROUTER_TPM = int(os.getenv("OPENROUTER_TPM", "1000000"))
+MAX_COMPLETION_TOKENS = 3000  # Increased to ensure complete JSON
+
+# Request JSON-schema structured outputs (response_format). Supported by the OpenAI models on
+# OpenRouter and by the Batch API; set STRUCTURED_OUTPUTS=0 for models without support.
+STRUCTURED_OUTPUTS = os.getenv("STRUCTURED_OUTPUTS", "1") != "0"
+
+# ===========================================
+# ALL-LANGUAGE RUN
+# ===========================================
+# GENERATE_LANGUAGE=all re-launches this script once per language as separate processes
+# running in parallel, each with its own worker pool and an equal share of the rate budget.
+# Each child's output goes to <OUTPUT_DIR>/<language>_generation.log.
+if CURRENT_LANGUAGE == "all":
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    children = []
+    for lang in ALL_LANGUAGES:
+        child_env = dict(
+            os.environ,
+            GENERATE_LANGUAGE=lang,
+            OPENROUTER_RPM=str(max(1, OPENROUTER_RPM // len(ALL_LANGUAGES))),
+            OPENROUTER_TPM=str(max(1, OPENROUTER_TPM // len(ALL_LANGUAGES)))
+        )
+        log_file = f"{OUTPUT_DIR}/{lang}_generation.log"
+        with open(log_file, "w", encoding="utf-8") as log:
+            proc = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + sys.argv[1:],
+                                    env=child_env, stdout=log, stderr=subprocess.STDOUT)
+        print(f"Started {lang} generation (pid {proc.pid}), log: {log_file}")
+        children.append((lang, proc))
+    sys.stdout.flush()
+    
+    exit_code = 0
+    for lang, proc in children:
+        proc.wait()
+        status = "✓" if proc.returncode == 0 else "✗"
+        print(f"{status} {lang} finished with exit code {proc.returncode}")
+        exit_code = exit_code or proc.returncode
+    sys.exit(exit_code)
+
 BUCKETS = {
     "A": (2, 3),
     "B": (3, 4),
@@ -57,6 +155,8 @@ BUCKETS = {
 
 COMPLEXITY_LEVELS = ["layman", "intermediate", "professional"]
 
+CASE_SUMMARY_MAX_CHARS = 800  # Case summaries are truncated to this length in prompts
+
 # Distribution per language (complexity x bucket)
 # Format: (language, complexity, bucket): count
 DISTRIBUTION = {
@@ -115,35 +215,116 @@ DISTRIBUTION_FILTERED = {
 }
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+if RESPONSE_CACHE_ENABLED:
+    os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
 
 # ===========================================
-# MODEL SETUP (OpenRouter API)
+# MODEL SETUP (OpenRouter API / OpenAI Batch API)
 # ===========================================
 print("=" * 60)
-print("Using OpenRouter API")
-print(f"Model: {OPENROUTER_MODEL}")
-print(f"API Key: {OPENROUTER_API_KEY[:10]}..." if OPENROUTER_API_KEY else "NOT SET")
+if GENERATION_MODE == "batch":
+    print("Using OpenAI Batch API")
+    print(f"Model: {OPENAI_BATCH_MODEL}")
+    print(f"API Key: {OPENAI_API_KEY[:10]}...")
+else:
+    print("Using OpenRouter API")
+    print(f"Model: {OPENROUTER_MODEL}")
+    print(f"API Key: {OPENROUTER_API_KEY[:10]}..." if OPENROUTER_API_KEY else "NOT SET")
 print("=" * 60)
 sys.stdout.flush()
 
+# A single module-level session is shared by every worker thread (and every batch call), so
+# all requests reuse one keep-alive connection pool instead of opening new connections.
 api_session = requests.Session()
-api_session.headers.update({
-    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-    "Content-Type": "application/json",
-    "HTTP-Referer": "https://github.com/your-repo",  # Optional: for tracking
-    "X-Title": "Hindi Legal Dialogue Generator"  # Optional: for tracking
-})
-print("✓ OpenRouter API configured")
+if GENERATION_MODE == "batch":
+    api_session.headers.update({"Authorization": f"Bearer {OPENAI_API_KEY}"})
+    print("✓ OpenAI Batch API configured")
+else:
+    api_session.headers.update({
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/your-repo",  # Optional: for tracking
+        "X-Title": "Hindi Legal Dialogue Generator"  # Optional: for tracking
+    })
+    # Keep-alive pool sized for the worker threads (default pool is 10 connections, which would
+    # churn TCP/TLS handshakes under concurrency); 429/5xx are retried here with exponential
+    # backoff, honoring Retry-After. POST must be listed explicitly since it is not idempotent.
+    openrouter_retry = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=sorted(RETRYABLE_STATUS_CODES),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True
+    )
+    api_session.mount("https://openrouter.ai", HTTPAdapter(
+        pool_connections=64,
+        pool_maxsize=max(64, MAX_CONCURRENT_REQUESTS),
+        max_retries=openrouter_retry
+    ))
+    print("✓ OpenRouter API configured")
 sys.stdout.flush()
 
+class RateLimiter:
+    """Thread-safe token bucket for the OpenRouter request/token budget.
+
+    Capacity is reserved *before* a request is dispatched (using an estimate of
+    the tokens it will consume) so concurrent workers are spread evenly over the
+    minute instead of bursting into 429s. Once the response arrives, release()
+    reconciles the reservation with the actual usage reported by the API.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests = min(self.requests_per_minute,
+                             self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute,
+                           self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens are available, reserve them and
+        return the number of tokens actually reserved (pass it to release)"""
+        tokens = min(tokens, self.tokens_per_minute)  # A single oversized request must still fit
+        with self._cond:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return tokens
+                timeout = max((1 - self._requests) * 60 / self.requests_per_minute,
+                              (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                              0.05)
+                self._cond.wait(timeout)
+
+    def release(self, reserved_tokens, used_tokens):
+        """Return unused reserved tokens (or charge the overrun) once actual usage is known"""
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.tokens_per_minute, self._tokens + reserved_tokens - used_tokens)
+            self._cond.notify_all()
+
+rate_limiter = RateLimiter(OPENROUTER_RPM, OPENROUTER_TPM)
+if GENERATION_MODE == "live":
+    print(f"✓ Rate limit: {OPENROUTER_RPM} requests/min, {OPENROUTER_TPM} tokens/min")
+    sys.stdout.flush()
+
 # ===========================================
 # PROMPT BUILDER
 # ===========================================
-def get_complexity_description(complexity, language):
-    """Get detailed complexity level description for USER behavior based on language"""
-    descriptions = {
-        "hindi": {
-            "layman": """USER (सामान्य जन स्तर):
+# USER behavior description per language and complexity level
+COMPLEXITY_DESCRIPTIONS = {
+    "hindi": {
+        "layman": """USER (सामान्य जन स्तर):
 - सरल, बुनियादी शब्दावली का उपयोग करता है
 - डर, भ्रम, या झिझक दिखाता है
 - भावनात्मक संकेत शामिल कर सकता है: "कृपया मदद करें", "मुझे डर लग रहा है", "मुझे समझ नहीं आ रहा"
@@ -156,7 +337,7 @@ def get_complexity_description(complexity, language):
 
 उदाहरण: "मुझे समझ नहीं आ रहा क्या करूँ, प्लीज़ मदद कीजिए। मेरा बच्चा डरा हुआ है।" """,
 
-            "intermediate": """USER (मध्यम स्तर):
+        "intermediate": """USER (मध्यम स्तर):
 - काफी स्पष्ट और पूर्ण वाक्यों का उपयोग करता है
 - मूल कानूनी जागरूकता है: FIR, शिकायत, पुलिस रिपोर्ट, "बाल सुरक्षा कानून"
 - एक क़ानून का नाम ("POCSO") उल्लेख कर सकता है लेकिन सटीक धारा नंबर नहीं
@@ -167,7 +348,7 @@ def get_complexity_description(complexity, language):
 
 उदाहरण: "क्या इस मामले में POCSO लागू होगा? FIR दर्ज करना आवश्यक है?" """,
 
-            "professional": """USER (पेशेवर स्तर):
+        "professional": """USER (पेशेवर स्तर):
 - NGO कार्यकर्ता, पैरालीगल, सामाजिक कार्यकर्ता, या सूचित नागरिक की तरह बोलता है
 - सटीक शब्दों का उपयोग करता है: "अनिवार्य रिपोर्टिंग", "POCSO की धारा 19", "CrPC के तहत बयान"
 - तकनीकी, प्रक्रियात्मक, या क़ानून-आधारित प्रश्न पूछता है
@@ -177,9 +358,9 @@ def get_complexity_description(complexity, language):
 - सभी पाठ केवल हिंदी में होना चाहिए (केवल आवश्यक संक्षिप्ताक्षर जैसे POCSO, FIR, IPC, CrPC, DLSA)
 
 उदाहरण: "क्या इस स्थिति में POCSO की धारा 19 के तहत रिपोर्टिंग अनिवार्य है?" """
-        },
-        "english": {
-            "layman": """The USER:
+    },
+    "english": {
+        "layman": """The USER:
 - Uses simple, basic vocabulary
 - Shows fear, confusion, or hesitation
 - May include emotional cues: "please help", "I am scared", "I don't understand"
@@ -191,7 +372,7 @@ def get_complexity_description(complexity, language):
 
 Example: "plz help… I dont kno wht to do… my child is scared" """,
 
-            "intermediate": """The USER:
+        "intermediate": """The USER:
 - Uses reasonably clear and complete sentences
 - Has basic legal awareness: FIR, complaint, police report, "child safety law"
 - May mention one statute name ("POCSO") but NOT exact section numbers
@@ -201,7 +382,7 @@ Example: "plz help… I dont kno wht to do… my child is scared" """,
 
 Example: "Can this be considered under the POCSO Act? Should we file an FIR?" """,
 
-            "professional": """The USER:
+        "professional": """The USER:
 - Speaks like an NGO worker, paralegal, social worker, or informed citizen
 - Uses precise terms: "mandatory reporting", "Section 19 POCSO", "statement under CrPC"
 - Asks technical, procedural, or statute-based questions
@@ -210,9 +391,9 @@ Example: "Can this be considered under the POCSO Act? Should we file an FIR?" ""
 - May cite specific sections or legal steps
 
 Example: "Does Section 19 of the POCSO Act require mandatory reporting in this scenario?" """
-        },
-        "code_mixed": {
-            "layman": """USER:
+    },
+    "code_mixed": {
+        "layman": """USER:
 - Simple, basic vocabulary use karta hai
 - Fear, confusion, ya hesitation dikhata hai
 - Emotional cues include kar sakta hai: "please help", "I am scared", "samajh nahi aa raha"
@@ -224,7 +405,7 @@ Example: "Does Section 19 of the POCSO Act require mandatory reporting in this s
 
 Example: "Sir pls help, mujhe process samajh nhi aa raha…" """,
 
-            "intermediate": """USER:
+        "intermediate": """USER:
 - Reasonably clear aur complete sentences use karta hai
 - Basic legal awareness hai: FIR, complaint, police report, "child safety law"
 - Ek statute name ("POCSO") mention kar sakta hai lekin exact section numbers NAHI
@@ -234,7 +415,7 @@ Example: "Sir pls help, mujhe process samajh nhi aa raha…" """,
 
 Example: "Is case me FIR file kar sakte hain? POCSO apply hota hai kya?" """,
 
-            "professional": """USER:
+        "professional": """USER:
 - NGO worker, paralegal, social worker, ya informed citizen ki tarah baat karta hai
 - Precise terms use karta hai: "mandatory reporting", "Section 19 POCSO", "statement under CrPC"
 - Technical, procedural, ya statute-based questions puchta hai
@@ -243,34 +424,34 @@ Example: "Is case me FIR file kar sakte hain? POCSO apply hota hai kya?" """,
 - Specific sections ya legal steps cite kar sakta hai
 
 Example: "As per POCSO Section 19, mandatory reporting apply karega yaha?" """
-        }
     }
-    lang_desc = descriptions.get(language, descriptions["hindi"])
+}
+
+@lru_cache(maxsize=16)
+def get_complexity_description(complexity, language):
+    """Get detailed complexity level description for USER behavior based on language"""
+    lang_desc = COMPLEXITY_DESCRIPTIONS.get(language, COMPLEXITY_DESCRIPTIONS["hindi"])
     return lang_desc.get(complexity, lang_desc["intermediate"])
 
-def build_prompt_hindi(case_summary, turns, complexity):
-    """Build prompt specifically for Hindi language"""
-    case_truncated = case_summary[:800] if len(case_summary) > 800 else case_summary
+def build_system_prompt_hindi(complexity):
+    """Build the static (cacheable) system prompt for Hindi language"""
     complexity_desc = get_complexity_description(complexity, "hindi")
     
     return f"""You are generating a structured, high-quality Hindi Child Sexual Abuse legal dialogue dataset for research on multilingual access-to-justice in India.
 
 **CRITICAL FOR HINDI: All text must be in Hindi only. Do NOT use English words. Only legal acronyms like POCSO, FIR, IPC, CrPC, DLSA are allowed. All sentences, phrases, and explanations must be in Hindi.**
 
-Using the case summary below, create a Hindi conversation between a USER and a LEGAL ASSISTANT.
-
-CASE SUMMARY:
-{case_truncated}
+For each request you will receive a case summary and the required number of exchanges. Using that case summary, create a Hindi conversation between a USER and a LEGAL ASSISTANT.
 
 ========================================================
 REQUIREMENTS
 ========================================================
 
 1. DIALOGUE LENGTH
-- Total dialogue length: {turns} user–assistant exchanges.
+- The number of user–assistant exchanges is given with each case summary.
 - A "turn" means: USER message → ASSISTANT reply.
 - Maintain the exact number of exchanges requested.
-- This means you need {turns * 2} total messages in the "turns" array (alternating user/assistant)
+- The "turns" array must contain twice that many messages (alternating user/assistant)
 
 --------------------------------------------------------
 2. COMPLEXITY LEVEL (IMPORTANT — affects USER behavior)
@@ -316,58 +497,25 @@ Choose the USER's speaking style exactly according to the assigned complexity:
     FIR, POCSO, धारा, IPC, पुलिस, बयान
 - वाक्यों को स्पष्ट और संक्षिप्त रखें
 - **महत्वपूर्ण: सभी पाठ केवल हिंदी में होना चाहिए। अंग्रेजी शब्दों का उपयोग न करें, केवल आवश्यक कानूनी संक्षिप्ताक्षर जैसे POCSO, FIR, IPC, CrPC, DLSA का उपयोग करें।**
+"""
 
-========================================================
-5. OUTPUT FORMAT (STRICT JSON)
-========================================================
-Output must be valid JSON:
-
-{{
-  "dialogue_id": "",
-  "language": "hindi",
-  "complexity": "{complexity}",
-  "turn_count": {turns},
-  "turns": [
-    {{"role": "user", "text": "..."}},
-    {{"role": "assistant", "text": "..."}},
-    {{"role": "user", "text": "..."}},
-    {{"role": "assistant", "text": "..."}}
-  ],
-  "statutes_cited": []
-}}
-
-CRITICAL REQUIREMENTS:
-- You MUST generate exactly {turns} user-assistant exchanges
-- This means you need {turns * 2} total messages in the "turns" array
-- The pattern MUST be: user → assistant → user → assistant → ... (alternating)
-- Do NOT add extra fields
-- Do NOT add commentary outside the JSON
-- Do NOT break JSON structure
-- Output ONLY valid JSON. No markdown, no explanations, no text before or after the JSON.
-
-Generate the dialogue now with EXACTLY {turns} user-assistant exchanges. Output ONLY the JSON object, nothing else:"""
-
-def build_prompt_english(case_summary, turns, complexity):
-    """Build prompt specifically for English language"""
-    case_truncated = case_summary[:800] if len(case_summary) > 800 else case_summary
+def build_system_prompt_english(complexity):
+    """Build the static (cacheable) system prompt for English language"""
     complexity_desc = get_complexity_description(complexity, "english")
     
     return f"""You are generating a structured, high-quality English Child Sexual Abuse legal dialogue dataset for research on multilingual access-to-justice in India.
 
-Using the case summary below, create an English conversation between a USER and a LEGAL ASSISTANT.
-
-CASE SUMMARY:
-{case_truncated}
+For each request you will receive a case summary and the required number of exchanges. Using that case summary, create an English conversation between a USER and a LEGAL ASSISTANT.
 
 ========================================================
 REQUIREMENTS
 ========================================================
 
 1. DIALOGUE LENGTH
-- Total dialogue length: {turns} user–assistant exchanges.
+- The number of user–assistant exchanges is given with each case summary.
 - A "turn" means: USER message → ASSISTANT reply.
 - Maintain the exact number of exchanges requested.
-- This means you need {turns * 2} total messages in the "turns" array (alternating user/assistant)
+- The "turns" array must contain twice that many messages (alternating user/assistant)
 
 --------------------------------------------------------
 2. COMPLEXITY LEVEL (IMPORTANT — affects USER behavior)
@@ -413,58 +561,25 @@ The Legal Assistant should:
 - Avoid Indianized English expressions
 - Maintain professional but accessible tone
 - Use proper grammar and spelling
+"""
 
-========================================================
-5. OUTPUT FORMAT (STRICT JSON)
-========================================================
-Output must be valid JSON:
-
-{{
-  "dialogue_id": "",
-  "language": "english",
-  "complexity": "{complexity}",
-  "turn_count": {turns},
-  "turns": [
-    {{"role": "user", "text": "..."}},
-    {{"role": "assistant", "text": "..."}},
-    {{"role": "user", "text": "..."}},
-    {{"role": "assistant", "text": "..."}}
-  ],
-  "statutes_cited": []
-}}
-
-CRITICAL REQUIREMENTS:
-- You MUST generate exactly {turns} user-assistant exchanges
-- This means you need {turns * 2} total messages in the "turns" array
-- The pattern MUST be: user → assistant → user → assistant → ... (alternating)
-- Do NOT add extra fields
-- Do NOT add commentary outside the JSON
-- Do NOT break JSON structure
-- Output ONLY valid JSON. No markdown, no explanations, no text before or after the JSON.
-
-Generate the dialogue now with EXACTLY {turns} user-assistant exchanges. Output ONLY the JSON object, nothing else:"""
-
-def build_prompt_code_mixed(case_summary, turns, complexity):
-    """Build prompt specifically for Code-mixed/Hinglish language"""
-    case_truncated = case_summary[:800] if len(case_summary) > 800 else case_summary
+def build_system_prompt_code_mixed(complexity):
+    """Build the static (cacheable) system prompt for Code-mixed/Hinglish language"""
     complexity_desc = get_complexity_description(complexity, "code_mixed")
     
     return f"""You are generating a structured, high-quality Code-mixed/Hinglish Child Sexual Abuse legal dialogue dataset for research on multilingual access-to-justice in India.
 
-Using the case summary below, create a Code-mixed/Hinglish conversation between a USER and a LEGAL ASSISTANT.
-
-CASE SUMMARY:
-{case_truncated}
+For each request you will receive a case summary and the required number of exchanges. Using that case summary, create a Code-mixed/Hinglish conversation between a USER and a LEGAL ASSISTANT.
 
 ========================================================
 REQUIREMENTS
 ========================================================
 
 1. DIALOGUE LENGTH
-- Total dialogue length: {turns} user–assistant exchanges.
+- The number of user–assistant exchanges is given with each case summary.
 - A "turn" means: USER message → ASSISTANT reply.
 - Maintain the exact number of exchanges requested.
-- This means you need {turns * 2} total messages in the "turns" array (alternating user/assistant)
+- The "turns" array must contain twice that many messages (alternating user/assistant)
 
 --------------------------------------------------------
 2. COMPLEXITY LEVEL (IMPORTANT — affects USER behavior)
@@ -512,7 +627,25 @@ Legal Assistant ko yeh karna chahiye:
 - Example: "Yeh case POCSO Section 7 ke under aa sakta hai, FIR lodge kar sakte ho."
 - Maintain conversational flow with natural mixing
 - Avoid forced or awkward translations
+"""
 
+# JSON output instructions, appended to every static system prompt
+if STRUCTURED_OUTPUTS:
+    # The response format is enforced by DIALOGUE_RESPONSE_FORMAT, so only field semantics are needed
+    JSON_SCHEMA_INSTRUCTIONS = """
+========================================================
+5. OUTPUT FORMAT
+========================================================
+Respond with the dialogue as a JSON object:
+- "dialogue_id": ""
+- "language": "{language}"
+- "complexity": "{complexity}"
+- "turn_count": the requested number of user-assistant exchanges
+- "turns": alternating messages, user → assistant → user → assistant → ..., exactly twice the requested number of exchanges
+- "statutes_cited": statutes/sections cited by the assistant
+"""
+else:
+    JSON_SCHEMA_INSTRUCTIONS = """
 ========================================================
 5. OUTPUT FORMAT (STRICT JSON)
 ========================================================
@@ -520,9 +653,9 @@ Output must be valid JSON:
 
 {{
   "dialogue_id": "",
-  "language": "code_mixed",
+  "language": "{language}",
   "complexity": "{complexity}",
-  "turn_count": {turns},
+  "turn_count": <number of exchanges>,
   "turns": [
     {{"role": "user", "text": "..."}},
     {{"role": "assistant", "text": "..."}},
@@ -533,178 +666,447 @@ Output must be valid JSON:
 }}
 
 CRITICAL REQUIREMENTS:
-- You MUST generate exactly {turns} user-assistant exchanges
-- This means you need {turns * 2} total messages in the "turns" array
+- You MUST generate exactly the requested number of user-assistant exchanges
+- This means the "turns" array has twice that many messages
 - The pattern MUST be: user → assistant → user → assistant → ... (alternating)
 - Do NOT add extra fields
 - Do NOT add commentary outside the JSON
 - Do NOT break JSON structure
 - Output ONLY valid JSON. No markdown, no explanations, no text before or after the JSON.
+"""
+
+# Structured outputs schema (response_format) matching the dialogue records
+DIALOGUE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "legal_dialogue",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "dialogue_id": {"type": "string"},
+                "language": {"type": "string"},
+                "complexity": {"type": "string"},
+                "turn_count": {"type": "integer"},
+                "turns": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "role": {"type": "string", "enum": ["user", "assistant"]},
+                            "text": {"type": "string"}
+                        },
+                        "required": ["role", "text"],
+                        "additionalProperties": False
+                    }
+                },
+                "statutes_cited": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["dialogue_id", "language", "complexity", "turn_count", "turns", "statutes_cited"],
+            "additionalProperties": False
+        }
+    }
+}
+
+def build_static_system_prompt(language, complexity, build_instructions):
+    """Language instructions followed by the JSON output instructions"""
+    return build_instructions(complexity) + JSON_SCHEMA_INSTRUCTIONS.format(language=language, complexity=complexity)
+
+# Static system prompts are built once per (language, complexity) so every request
+# for the same configuration starts with a byte-identical prefix; this is what lets
+# OpenRouter/OpenAI prompt caching reuse the (multi-KB) instructions across calls.
+STATIC_SYSTEM_PROMPT = {
+    "hindi": {c: build_static_system_prompt("hindi", c, build_system_prompt_hindi) for c in COMPLEXITY_LEVELS},
+    "english": {c: build_static_system_prompt("english", c, build_system_prompt_english) for c in COMPLEXITY_LEVELS},
+    "code_mixed": {c: build_static_system_prompt("code_mixed", c, build_system_prompt_code_mixed) for c in COMPLEXITY_LEVELS},
+}
+
+# Several dialogues in one response: {"dialogues": [...]}, one entry per case in request order
+BATCHED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "legal_dialogues",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "dialogues": {
+                    "type": "array",
+                    "items": DIALOGUE_RESPONSE_FORMAT["json_schema"]["schema"]
+                }
+            },
+            "required": ["dialogues"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Per-request part of the prompt, formatted with a single str.format_map pass
+USER_MESSAGE_TEMPLATE = """CASE SUMMARY:
+{case}
+
+Generate the dialogue now with EXACTLY {turns} user-assistant exchanges ({total_messages} messages in the "turns" array)."""
+if not STRUCTURED_OUTPUTS:
+    USER_MESSAGE_TEMPLATE += " Output ONLY the JSON object, nothing else:"
+
+def build_user_message(case_summary, turns):
+    """Build the short per-request part of the prompt (case summary and turn count).
+
+    case_summary is expected to be already truncated to CASE_SUMMARY_MAX_CHARS (done once at load time).
+    """
+    return USER_MESSAGE_TEMPLATE.format_map({
+        "case": case_summary,
+        "turns": turns,
+        "total_messages": turns * 2,
+    })
+
+BATCHED_CASE_TEMPLATE = """CASE {number} SUMMARY:
+{case}
+
+Dialogue {number}: EXACTLY {turns} user-assistant exchanges ({total_messages} messages in its "turns" array)."""
+
+BATCHED_USER_MESSAGE_TEMPLATE = """Generate {count} independent dialogues, one for each case below.
+
+{cases}
+
+Respond with a JSON object {{"dialogues": [...]}} holding the {count} dialogue objects in the order of the cases, each in the format described above."""
+if not STRUCTURED_OUTPUTS:
+    BATCHED_USER_MESSAGE_TEMPLATE += " Output ONLY the JSON object, nothing else:"
+
+def build_batched_user_message(specs):
+    """Build the per-request part of a multi-dialogue prompt from (case_summary, turns) pairs"""
+    cases = "\n\n".join(
+        BATCHED_CASE_TEMPLATE.format_map({
+            "number": number,
+            "case": case_summary,
+            "turns": turns,
+            "total_messages": turns * 2,
+        })
+        for number, (case_summary, turns) in enumerate(specs, 1)
+    )
+    return BATCHED_USER_MESSAGE_TEMPLATE.format_map({"count": len(specs), "cases": cases})
+
+def build_messages(system_prompt, user_message):
+    """Chat messages with the static system prompt marked as a cacheable prefix"""
+    return [
+        {
+            "role": "system",
+            "content": [
+                {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+            ]
+        },
+        {"role": "user", "content": user_message}
+    ]
 
-Generate the dialogue now with EXACTLY {turns} user-assistant exchanges. Output ONLY the JSON object, nothing else:"""
+def build_prompt_hindi(case_summary, turns, complexity):
+    """Build prompt specifically for Hindi language"""
+    return build_messages(STATIC_SYSTEM_PROMPT["hindi"][complexity],
+                          build_user_message(case_summary, turns))
+
+def build_prompt_english(case_summary, turns, complexity):
+    """Build prompt specifically for English language"""
+    return build_messages(STATIC_SYSTEM_PROMPT["english"][complexity],
+                          build_user_message(case_summary, turns))
+
+def build_prompt_code_mixed(case_summary, turns, complexity):
+    """Build prompt specifically for Code-mixed/Hinglish language"""
+    return build_messages(STATIC_SYSTEM_PROMPT["code_mixed"][complexity],
+                          build_user_message(case_summary, turns))
+
+PROMPT_BUILDERS = {
+    "hindi": build_prompt_hindi,
+    "english": build_prompt_english,
+    "code_mixed": build_prompt_code_mixed,
+}
 
 def build_prompt(case_summary, turns, complexity, language):
-    """Main prompt builder that routes to language-specific functions"""
-    if language == "hindi":
-        return build_prompt_hindi(case_summary, turns, complexity)
-    elif language == "english":
-        return build_prompt_english(case_summary, turns, complexity)
-    elif language == "code_mixed":
-        return build_prompt_code_mixed(case_summary, turns, complexity)
-    else:
-        # Fallback to Hindi
-        return build_prompt_hindi(case_summary, turns, complexity)
+    """Main prompt builder that routes to language-specific functions (falls back to Hindi)"""
+    return PROMPT_BUILDERS.get(language, build_prompt_hindi)(case_summary, turns, complexity)
+
+@lru_cache(maxsize=2048)
+def build_case_prompt(case_idx, turns, complexity, language):
+    """build_prompt for CASES[case_idx], memoized so retries of a case reuse the messages (shared; do not mutate)"""
+    return build_prompt(CASES[case_idx], turns, complexity, language)
+
+def build_batched_prompt(specs, complexity, language):
+    """Prompt for several dialogues of one language/complexity; specs are (case_summary, turns) pairs"""
+    system_prompts = STATIC_SYSTEM_PROMPT.get(language, STATIC_SYSTEM_PROMPT["hindi"])
+    return build_messages(system_prompts[complexity], build_batched_user_message(specs))
 
 # ===========================================
 # GENERATE
 # ===========================================
+# Regexes used while parsing model output, compiled once at import
+# Markdown code fences around the model's JSON (```json ... ```)
+JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.MULTILINE)
+CODE_BLOCK_JSON_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)  # ```json {...} ```
+CODE_BLOCK_RE = re.compile(r'```\s*(\{.*?\})\s*```', re.DOTALL)  # ``` {...} ```
+# clean_json_text
+CTRL_CHARS_RE = re.compile(r'[\x00-\x1f]+')
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+SINGLE_QUOTE_KEY_RE = re.compile(r"'([^']*)':")
+SINGLE_QUOTE_VALUE_RE = re.compile(r":\s*'([^']*)'")
+LINE_COMMENT_RE = re.compile(r'//.*?$', re.MULTILINE)
+BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+# Errors a failed parse attempt may raise (orjson.JSONDecodeError subclasses json.JSONDecodeError)
+JSON_PARSE_ERRORS = (json.JSONDecodeError, ValueError, TypeError)
+
+def json_loads(text):
+    """Parse JSON with orjson when available, falling back to the standard library"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def json_dumps(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (non-ASCII kept as-is) with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+if msgspec is not None:
+    class Turn(msgspec.Struct):
+        role: Literal["user", "assistant"]
+        text: str
+
+    class Dialogue(msgspec.Struct, kw_only=True, omit_defaults=True):
+        language: Optional[str] = None
+        complexity: Optional[str] = None
+        turn_count: Optional[int] = None
+        turns: List[Turn]
+        statutes_cited: List[str] = []
+
+    DIALOGUE_DECODER = msgspec.json.Decoder(Dialogue)
+
+def decode_dialogue(output):
+    """Strictly decode a well-formed dialogue with msgspec, validating turns during the parse.
+
+    Returns a plain dict, or None if msgspec is not installed or the output is not
+    exactly a dialogue object (the caller then falls back to safe_parse_json).
+    """
+    if msgspec is None:
+        return None
+    try:
+        return msgspec.to_builtins(DIALOGUE_DECODER.decode(output))
+    except msgspec.DecodeError:  # Also covers msgspec.ValidationError
+        return None
+
+def parse_json_candidate(json_text: str):
+    """Parse a candidate JSON span as-is, running clean_json_text only if that fails"""
+    try:
+        return json_loads(json_text)
+    except JSON_PARSE_ERRORS:
+        return json_loads(clean_json_text(json_text))
+
+def find_balanced_end(text: str, start: int) -> int:
+    """Index of the "}" closing the "{" at text[start], or -1 if it is never closed.
+
+    Jumps from brace to brace with str.find (C-level scans over the runs of dialogue
+    text in between) instead of stepping through every character in Python.
+    """
+    depth = 0
+    pos = start
+    next_close = text.find("}", start)
+    while next_close != -1:
+        next_open = text.find("{", pos, next_close)
+        if next_open != -1:
+            depth += 1
+            pos = next_open + 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return next_close
+            pos = next_close + 1
+            next_close = text.find("}", pos)
+    return -1
+
 def safe_parse_json(text: str):
     """More robust JSON parsing with multiple fallback strategies"""
     if not text:
         return None
-    
-    # Remove leading/trailing whitespace
     text = text.strip()
     
+    # Fast path: well-formed JSON (the usual case, and always with structured outputs),
+    # on its own or wrapped in fences/prose, parses without any regex work
+    if text.startswith("{"):
+        try:
+            return json_loads(text)
+        except JSON_PARSE_ERRORS:
+            pass
+    first_brace = text.find("{")
+    last_brace = text.rfind("}")
+    # Skip the slice when it is the whole text (already tried just above)
+    if first_brace != -1 and last_brace > first_brace and (first_brace > 0 or last_brace < len(text) - 1):
+        try:
+            return json_loads(text[first_brace:last_brace+1])
+        except JSON_PARSE_ERRORS:
+            pass
+    
     # Strategy 1: Try to extract JSON from markdown code blocks (most common)
-    code_block_patterns = [
-        r'```(?:json)?\s*(\{.*?\})\s*```',  # ```json {...} ```
-        r'```\s*(\{.*?\})\s*```',  # ``` {...} ```
-    ]
-    for pattern in code_block_patterns:
-        match = re.search(pattern, text, re.DOTALL)
+    for pattern in (CODE_BLOCK_JSON_RE, CODE_BLOCK_RE):
+        match = pattern.search(text)
         if match:
-            json_text = match.group(1)
             try:
-                # Clean and parse
-                json_text = clean_json_text(json_text)
-                return json.loads(json_text)
-            except:
+                return parse_json_candidate(match.group(1))
+            except JSON_PARSE_ERRORS:
                 continue
     
-    # Strategy 2: Find balanced braces (handle nested JSON)
+    # Strategy 2: Find balanced braces (handle nested JSON). If a span does not parse
+    # (e.g. "{placeholder}" in leading prose), move on to the next one; each character
+    # is scanned at most once, so this stays linear in the length of the text.
     start = text.find("{")
-    if start != -1:
-        brace_count = 0
-        end = start
-        for i in range(start, len(text)):
-            if text[i] == '{':
-                brace_count += 1
-            elif text[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    end = i
-                    break
+    while start != -1:
+        end = find_balanced_end(text, start)
+        if end == -1:
+            break  # Unbalanced up to the end of the text
         
-        if brace_count == 0 and end > start:
-            json_text = text[start:end+1]
-            try:
-                json_text = clean_json_text(json_text)
-                return json.loads(json_text)
-            except:
-                pass
-    
-    # Strategy 3: Try regex to find JSON object (simpler pattern)
-    json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', text, re.DOTALL)
-    if json_match:
-        json_text = json_match.group(0)
         try:
-            json_text = clean_json_text(json_text)
-            return json.loads(json_text)
-        except:
+            return parse_json_candidate(text[start:end+1])
+        except JSON_PARSE_ERRORS:
             pass
+        start = text.find("{", end + 1)
     
-    # Strategy 4: Find first { and last } (fallback)
-    start = text.find("{")
-    end = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        json_text = text[start:end+1]
+    # Strategy 3: Find first { and last } (fallback); the fast path already tried this
+    # span as-is, so go straight to the cleaned version
+    if first_brace != -1 and last_brace > first_brace:
         try:
-            json_text = clean_json_text(json_text)
-            return json.loads(json_text)
-        except:
+            return json_loads(clean_json_text(text[first_brace:last_brace+1]))
+        except JSON_PARSE_ERRORS:
             pass
 
     return None
 
 def clean_json_text(json_text: str) -> str:
     """Clean JSON text to fix common issues"""
+    # Remove markdown code fences left inside the candidate span
+    if "```" in json_text:
+        json_text = JSON_FENCE_RE.sub("", json_text)
+    
     # Remove control characters
-    json_text = re.sub(r'[\x00-\x1f]+', '', json_text)
+    json_text = CTRL_CHARS_RE.sub('', json_text)
     
     # Remove trailing commas before closing braces/brackets
-    json_text = re.sub(r',\s*([}\]])', r'\1', json_text)
+    json_text = TRAILING_COMMA_RE.sub(r'\1', json_text)
     
     # Fix common quote issues (single quotes to double quotes)
     # But be careful - only fix unquoted single quotes, not inside strings
     # This is a simplified version - might need more sophisticated handling
-    json_text = re.sub(r"'([^']*)':", r'"\1":', json_text)  # Keys
-    json_text = re.sub(r":\s*'([^']*)'", r': "\1"', json_text)  # String values
+    # (the substring checks are cheap and let most outputs skip these regexes)
+    if "'" in json_text:
+        json_text = SINGLE_QUOTE_KEY_RE.sub(r'"\1":', json_text)  # Keys
+        json_text = SINGLE_QUOTE_VALUE_RE.sub(r': "\1"', json_text)  # String values
     
     # Remove comments (JSON doesn't support comments)
-    json_text = re.sub(r'//.*?$', '', json_text, flags=re.MULTILINE)
-    json_text = re.sub(r'/\*.*?\*/', '', json_text, flags=re.DOTALL)
+    if "//" in json_text:
+        json_text = LINE_COMMENT_RE.sub('', json_text)
+    if "/*" in json_text:
+        json_text = BLOCK_COMMENT_RE.sub('', json_text)
     
     return json_text
 
+LANG_PREFIXES = {"hindi": "HN", "english": "EN", "code_mixed": "CM"}
+
+def make_dialogue_id(language, bucket_key, case_id, idx):
+    """Dialogue ID such as HN_A_C0001_001 (language prefix, bucket, case, running index)"""
+    lang_prefix = LANG_PREFIXES.get(language, "HN")
+    return f"{lang_prefix}_{bucket_key}_C{case_id:04d}_{idx:03d}"
+
+# Language-specific fallback messages
+FALLBACK_MESSAGES = {
+    "hindi": {
+        "user": "कृपया मुझे इस मामले के बारे में जानकारी दें।",
+        "assistant": "मैं आपकी सहायता करने के लिए यहाँ हूँ। कृपया अपने प्रश्न पूछें।"
+    },
+    "english": {
+        "user": "Please provide me information about this case.",
+        "assistant": "I am here to help you. Please ask your questions."
+    },
+    "code_mixed": {
+        "user": "Please mujhe is case ke bare me information dijiye.",
+        "assistant": "Main aapki help karne ke liye yahan hoon. Apne questions puchiye."
+    }
+}
+
+# Fallback turns for the longest bucket, built once per language; dialogues take a slice
+FALLBACK_MAX_TURNS = max(max_t for _, max_t in BUCKETS.values())
+FALLBACK_TURNS = {
+    language: [
+        {"role": role, "text": msg[role]}
+        for _ in range(FALLBACK_MAX_TURNS)
+        for role in ("user", "assistant")
+    ]
+    for language, msg in FALLBACK_MESSAGES.items()
+}
+
 def create_fallback_dialogue(case_summary, turns, complexity, bucket_key, idx, language, case_id):
     """Create a simple fallback dialogue structure when JSON parsing fails"""
-    lang_prefix = {"hindi": "HN", "english": "EN", "code_mixed": "CM"}.get(language, "HN")
-    dialogue_id = f"{lang_prefix}_{bucket_key}_C{case_id:04d}_{idx:03d}"
-    
-    # Language-specific fallback messages
-    fallback_messages = {
-        "hindi": {
-            "user": "कृपया मुझे इस मामले के बारे में जानकारी दें।",
-            "assistant": "मैं आपकी सहायता करने के लिए यहाँ हूँ। कृपया अपने प्रश्न पूछें।"
-        },
-        "english": {
-            "user": "Please provide me information about this case.",
-            "assistant": "I am here to help you. Please ask your questions."
-        },
-        "code_mixed": {
-            "user": "Please mujhe is case ke bare me information dijiye.",
-            "assistant": "Main aapki help karne ke liye yahan hoon. Apne questions puchiye."
-        }
-    }
-    msg = fallback_messages.get(language, fallback_messages["hindi"])
+    dialogue_id = make_dialogue_id(language, bucket_key, case_id, idx)
+    fallback_turns = FALLBACK_TURNS.get(language, FALLBACK_TURNS["hindi"])
     
     return {
         "dialogue_id": dialogue_id,
         "language": language,
         "complexity": complexity,
         "turn_count": turns,
-        "turns": [
-            {"role": "user", "text": msg["user"]},
-            {"role": "assistant", "text": msg["assistant"]}
-        ] * turns,
+        "turns": fallback_turns[:turns * 2],  # turns = user-assistant exchanges
         "statutes_cited": []
     }
 
-def generate_via_openrouter(prompt: str, max_retries: int = 2) -> Optional[str]:
+def message_chars(messages: List[Dict[str, Any]]) -> int:
+    """Total number of characters across chat messages (plain or content-part format)"""
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            total += len(content)
+        else:
+            total += sum(len(part.get("text", "")) for part in content)
+    return total
+
+# Prompt-cache statistics reported by the API (usage.prompt_tokens_details.cached_tokens)
+usage_totals = {"prompt_tokens": 0, "cached_tokens": 0}
+usage_lock = threading.Lock()
+
+def record_usage(usage: Dict[str, Any]):
+    """Accumulate prompt and cached-prompt token counts from an API response"""
+    details = usage.get("prompt_tokens_details") or {}
+    with usage_lock:
+        usage_totals["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        usage_totals["cached_tokens"] += details.get("cached_tokens") or 0
+
+def generate_via_openrouter(messages: List[Dict[str, Any]], max_retries: int = 2,
+                            response_format: Dict[str, Any] = DIALOGUE_RESPONSE_FORMAT,
+                            max_tokens: int = MAX_COMPLETION_TOKENS) -> Optional[str]:
     """Generate text using OpenRouter API with retry logic"""
     if not api_session:
         raise ValueError("OpenRouter API session not initialized")
     
+    # Rough estimate (~4 chars per token) plus the completion budget; corrected after the call
+    estimated_tokens = message_chars(messages) // 4 + max_tokens
+    
     for attempt in range(max_retries + 1):
         payload = {
             "model": OPENROUTER_MODEL,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
+            "messages": messages,
             "temperature": 0.5 if attempt == 0 else 0.3,  # Lower temp on retry
-            "max_tokens": 3000,  # Increased to ensure complete JSON
+            "max_tokens": max_tokens,
             "top_p": 0.85
         }
+        if STRUCTURED_OUTPUTS:
+            payload["response_format"] = response_format
     
+        reserved_tokens = rate_limiter.acquire(estimated_tokens)
+        used_tokens = 0
         try:
             response = api_session.post(
                 "https://openrouter.ai/api/v1/chat/completions",
                 json=payload,
-                timeout=120
+                timeout=120 * max(1, max_tokens // MAX_COMPLETION_TOKENS)  # Longer for multi-dialogue calls
             )
             response.raise_for_status()
             data = response.json()
+            usage = data.get("usage") or {}
+            used_tokens = usage.get("total_tokens") or estimated_tokens
+            record_usage(usage)
             
             # Extract generated text
             if "choices" in data and len(data["choices"]) > 0:
@@ -724,39 +1126,82 @@ def generate_via_openrouter(prompt: str, max_retries: int = 2) -> Optional[str]:
                     print(f"  API response error: {data}")
                     sys.stdout.flush()
                     return None
-        except requests.exceptions.RequestException as e:
+        except requests.exceptions.JSONDecodeError as e:
+            # Malformed (non-JSON) response body; a RequestException subclass, but worth another attempt
             if attempt < max_retries:
-                print(f"  API request failed, retrying... (attempt {attempt + 1}/{max_retries + 1}): {str(e)}")
+                print(f"  Malformed API response, retrying... (attempt {attempt + 1}/{max_retries + 1}): {str(e)}")
                 sys.stdout.flush()
-                time.sleep(2)  # Wait before retry
                 continue
             else:
-                print(f"  API request failed: {str(e)}")
+                print(f"  Malformed API response: {str(e)}")
                 sys.stdout.flush()
                 return None
+        except requests.exceptions.RequestException as e:
+            # Connection errors and 429/5xx were already retried with backoff by the session adapter
+            print(f"  API request failed: {str(e)}")
+            sys.stdout.flush()
+            return None
         except Exception as e:
             if attempt < max_retries:
                 print(f"  API error, retrying... (attempt {attempt + 1}/{max_retries + 1}): {str(e)}")
                 sys.stdout.flush()
-                time.sleep(2)
                 continue
             else:
                 print(f"  API error: {str(e)}")
                 sys.stdout.flush()
                 return None
+        finally:
+            rate_limiter.release(reserved_tokens, used_tokens)
     
     return None
 
-def generate_dialogue(case_summary, bucket_key, idx, complexity, language, case_id):
-    min_t, max_t = BUCKETS[bucket_key]
-    turns = random.randint(min_t, max_t)
-    # Complexity and language are passed as parameters to ensure equal distribution
+def response_cache_key(model, messages, dialogue_id):
+    """Hash of the canonicalized request (model + messages) and the planned dialogue ID(s).
 
-    prompt = build_prompt(case_summary, turns, complexity, language)
+    The ID is part of the key because a re-planned dialogue can land on a case, complexity
+    and turn count that was already generated (same prompt); only a rerun of the same
+    planned dialogue may replay a cached response, never a different dialogue.
+    """
+    canonical = json.dumps({"model": model, "messages": messages, "dialogue_id": dialogue_id},
+                           sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+def cache_get(key):
+    """Return the cached model response for key, or None"""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    try:
+        return (Path(RESPONSE_CACHE_DIR) / f"{key}.txt").read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+def cache_put(key, output):
+    """Store a model response (written to a temp file and renamed, so readers never see partial files)"""
+    if not RESPONSE_CACHE_ENABLED:
+        return
+    path = Path(RESPONSE_CACHE_DIR) / f"{key}.txt"
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    tmp_path.write_text(output, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+def generate_dialogue(bucket_key, idx, complexity, language, case_id, turns):
+    # Complexity, language and turn count are planned up front to ensure equal distribution
+    # The case is identified by its 1-indexed case_id; the prompt is memoized per case
+    case_summary = CASES[case_id - 1]
+
+    messages = build_case_prompt(case_id - 1, turns, complexity, language)
+    cache_key = response_cache_key(OPENROUTER_MODEL, messages,
+                                   make_dialogue_id(language, bucket_key, case_id, idx))
+    output = cache_get(cache_key)
+    if output is not None:
+        result, is_fallback = parse_dialogue(output, case_summary, turns, bucket_key, idx, complexity, language, case_id)
+        # A cached response that does not parse (e.g. stored by an older version) counts as a miss
+        if result is not None and not is_fallback:
+            return result
 
     try:
         # Use OpenRouter API
-        output = generate_via_openrouter(prompt)
+        output = generate_via_openrouter(messages)
         if output is None:
             return None
     except Exception as e:
@@ -764,51 +1209,80 @@ def generate_dialogue(case_summary, bucket_key, idx, complexity, language, case_
         sys.stdout.flush()
         return None
 
+    result, is_fallback = parse_dialogue(output, case_summary, turns, bucket_key, idx, complexity, language, case_id)
+    # Only cache responses that parsed into a valid dialogue (never fallbacks), so reruns and
+    # retries are not stuck replaying a bad one
+    if result is not None and not is_fallback:
+        cache_put(cache_key, output)
+    return result
+
+VALID_ROLES = frozenset(("user", "assistant"))
+
+def validate_dialogue(data, turns, bucket_key, idx, complexity, language, case_id, turns_validated=False):
+    """Normalize a parsed dialogue object into a dataset record (None if it has no valid turns).
+
+    turns_validated skips the per-turn checks for data that came from decode_dialogue.
+    """
+    # Validate that we have required fields
+    if "turns" not in data:
+        data["turns"] = []
+    if "statutes_cited" not in data:
+        data["statutes_cited"] = []
+    
+    # Remove safety_notes if present
+    if "safety_notes" in data:
+        del data["safety_notes"]
+    
+    # Remove case_summary if present (we only keep case_id for reference)
+    if "case_summary" in data:
+        del data["case_summary"]
+    
+    data["dialogue_id"] = make_dialogue_id(language, bucket_key, case_id, idx)
+    data["language"] = data.get("language", language)
+    data["complexity"] = data.get("complexity", complexity)
+    data["turn_count"] = data.get("turn_count", turns)
+    data["bucket"] = bucket_key
+    
+    # Validate that we have at least some turns
+    if not data["turns"] or len(data["turns"]) == 0:
+        print(f"  Warning: No turns found in parsed JSON")
+        sys.stdout.flush()
+        return None
+    
+    if turns_validated:
+        return data
+    
+    # Validate turn structure
+    valid_turns = []
+    for turn in data["turns"]:
+        if isinstance(turn, dict) and "role" in turn and "text" in turn:
+            if isinstance(turn["role"], str) and turn["role"] in VALID_ROLES:
+                valid_turns.append(turn)
+    
+    if len(valid_turns) == 0:
+        print(f"  Warning: No valid turns found")
+        sys.stdout.flush()
+        return None
+    
+    data["turns"] = valid_turns
+    return data
+
+def parse_dialogue(output, case_summary, turns, bucket_key, idx, complexity, language, case_id):
+    """Parse and validate a model response into a dialogue record (fallback dialogue if not JSON).
+
+    Returns (record, is_fallback); record is None if the JSON had no valid turns.
+    """
+    # Well-formed output (e.g. with structured outputs) is parsed and validated in one pass
+    data = decode_dialogue(output)
+    if data is not None:
+        return validate_dialogue(data, turns, bucket_key, idx, complexity, language, case_id,
+                                 turns_validated=True), False
+    
     # Try robust JSON parsing
     data = safe_parse_json(output)
     
     if data and isinstance(data, dict):
-        # Validate that we have required fields
-        if "turns" not in data:
-            data["turns"] = []
-        if "statutes_cited" not in data:
-            data["statutes_cited"] = []
-        
-        # Remove safety_notes if present
-        if "safety_notes" in data:
-            del data["safety_notes"]
-        
-        # Remove case_summary if present (we only keep case_id for reference)
-        if "case_summary" in data:
-            del data["case_summary"]
-        
-        lang_prefix = {"hindi": "HN", "english": "EN", "code_mixed": "CM"}.get(language, "HN")
-        data["dialogue_id"] = f"{lang_prefix}_{bucket_key}_C{case_id:04d}_{idx:03d}"
-        data["language"] = data.get("language", language)
-        data["complexity"] = data.get("complexity", complexity)
-        data["turn_count"] = data.get("turn_count", turns)
-        data["bucket"] = bucket_key
-        
-        # Validate that we have at least some turns
-        if not data["turns"] or len(data["turns"]) == 0:
-            print(f"  Warning: No turns found in parsed JSON")
-            sys.stdout.flush()
-            return None
-        
-        # Validate turn structure
-        valid_turns = []
-        for turn in data["turns"]:
-            if isinstance(turn, dict) and "role" in turn and "text" in turn:
-                if turn["role"] in ["user", "assistant"]:
-                    valid_turns.append(turn)
-        
-        if len(valid_turns) == 0:
-            print(f"  Warning: No valid turns found")
-            sys.stdout.flush()
-            return None
-        
-        data["turns"] = valid_turns
-        return data
+        return validate_dialogue(data, turns, bucket_key, idx, complexity, language, case_id), False
     else:
         # If the model didn't follow JSON format, fall back to a minimal valid structure
         # so the dataset can still reach the target size.
@@ -822,29 +1296,226 @@ def generate_dialogue(case_summary, bucket_key, idx, complexity, language, case_
             idx=idx,
             language=language,
             case_id=case_id
+        ), True
+
+def generate_dialogue_group(tasks):
+    """Generate several planned dialogues (same language and complexity) with one API call.
+
+    Returns one result per task, None where the combined response had no usable dialogue
+    for it; no fallback dialogues are made here since such tasks are retried on their own.
+    """
+    (language, complexity, _), _, _, _, _ = tasks[0]
+    specs = [(CASES[case_idx], turns) for _, case_idx, _, _, turns in tasks]
+    messages = build_batched_prompt(specs, complexity, language)
+    dialogue_ids = [make_dialogue_id(lang, bucket, case_idx + 1, idx)
+                    for (lang, _, bucket), case_idx, _, idx, _ in tasks]
+    cache_key = response_cache_key(OPENROUTER_MODEL, messages, ",".join(dialogue_ids))
+    output = cache_get(cache_key)
+    from_cache = output is not None
+
+    if not from_cache:
+        try:
+            output = generate_via_openrouter(messages,
+                                             response_format=BATCHED_RESPONSE_FORMAT,
+                                             max_tokens=MAX_COMPLETION_TOKENS * len(tasks))
+        except Exception as e:
+            print(f"  Error during generation: {str(e)}")
+            sys.stdout.flush()
+            output = None
+        if output is None:
+            return [None] * len(tasks)
+
+    data = safe_parse_json(output)
+    items = data.get("dialogues") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        items = []
+    results = []
+    for i, ((lang, _, bucket), case_idx, _, idx, turns) in enumerate(tasks):
+        item = items[i] if i < len(items) else None
+        if isinstance(item, dict):
+            results.append(validate_dialogue(item, turns, bucket, idx, complexity, lang, case_idx + 1))
+        else:
+            results.append(None)
+    if all(results) and not from_cache:
+        cache_put(cache_key, output)
+    return results
+
+# ===========================================
+# BATCH MODE (OpenAI Batch API)
+# ===========================================
+OPENAI_API_BASE = "https://api.openai.com/v1"
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def to_plain_messages(messages):
+    """Flatten content-part messages to plain strings (OpenAI caches identical prefixes automatically)"""
+    return [
+        {
+            "role": message["role"],
+            "content": message["content"] if isinstance(message["content"], str)
+            else "".join(part["text"] for part in message["content"])
+        }
+        for message in messages
+    ]
+
+def run_batch(tasks):
+    """Generate one round of dialogues through the OpenAI Batch API.
+
+    Writes every request to a JSONL input file, submits it as a single batch job,
+    polls until the job finishes and then yields (task, result) pairs in the same
+    shape as the live path; requests that failed inside the batch yield None.
+    """
+    pending = {}
+    cache_keys = {}
+    batch_input_file = f"{OUTPUT_DIR}/{CURRENT_LANGUAGE}_batch_input.jsonl"
+    with open(batch_input_file, "wb") as bf:
+        for task in tasks:
+            combo, case_idx, _, idx, turns = task
+            lang, complexity, bucket = combo
+            custom_id = make_dialogue_id(lang, bucket, case_idx + 1, idx)
+            messages = to_plain_messages(build_case_prompt(case_idx, turns, complexity, lang))
+            cache_key = response_cache_key(OPENAI_BATCH_MODEL, messages, custom_id)
+            cached = cache_get(cache_key)
+            if cached is not None:
+                result, is_fallback = parse_dialogue(cached, CASES[case_idx], turns, bucket, idx, complexity, lang, case_idx + 1)
+                if result is not None and not is_fallback:
+                    yield task, result
+                    continue
+            cache_keys[custom_id] = cache_key
+            body = {
+                "model": OPENAI_BATCH_MODEL,
+                "messages": messages,
+                "temperature": 0.5,
+                "max_completion_tokens": MAX_COMPLETION_TOKENS,
+                "top_p": 0.85
+            }
+            if STRUCTURED_OUTPUTS:
+                body["response_format"] = DIALOGUE_RESPONSE_FORMAT
+            bf.write(json_dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body
+            }))
+            bf.write(b"\n")
+            pending[custom_id] = task
+    
+    if not pending:
+        return
+    
+    # Upload the input file and submit the batch job
+    with open(batch_input_file, "rb") as bf:
+        response = api_session.post(
+            f"{OPENAI_API_BASE}/files",
+            data={"purpose": "batch"},
+            files={"file": (Path(batch_input_file).name, bf, "application/jsonl")},
+            timeout=300
+        )
+    response.raise_for_status()
+    input_file_id = response.json()["id"]
+    
+    response = api_session.post(
+        f"{OPENAI_API_BASE}/batches",
+        json={
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+            "metadata": {"language": CURRENT_LANGUAGE}
+        },
+        timeout=60
+    )
+    response.raise_for_status()
+    batch = response.json()
+    print(f"Submitted batch {batch['id']} with {len(pending)} requests (input file: {batch_input_file})")
+    sys.stdout.flush()
+    
+    # Poll until the batch reaches a final state
+    while batch["status"] not in BATCH_FINAL_STATUSES:
+        time.sleep(BATCH_POLL_SECONDS)
+        try:
+            response = api_session.get(f"{OPENAI_API_BASE}/batches/{batch['id']}", timeout=60)
+            response.raise_for_status()
+            batch = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"  Batch status check failed, will retry: {str(e)}")
+            sys.stdout.flush()
+            continue
+        counts = batch.get("request_counts") or {}
+        print(f"  Batch {batch['id']}: {batch['status']} "
+              f"({counts.get('completed', 0)}/{counts.get('total', len(pending))} completed, "
+              f"{counts.get('failed', 0)} failed)")
+        sys.stdout.flush()
+    
+    if batch["status"] == "failed":
+        raise RuntimeError(f"Batch {batch['id']} failed: {batch.get('errors')}")
+    
+    # Stream the output file back (expired/cancelled batches still return finished requests)
+    outputs = {}
+    if batch.get("output_file_id"):
+        response = api_session.get(
+            f"{OPENAI_API_BASE}/files/{batch['output_file_id']}/content",
+            stream=True,
+            timeout=300
         )
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            item = json_loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            record_usage(body.get("usage") or {})
+            choices = body.get("choices") or []
+            if choices and choices[0]["message"].get("content"):
+                outputs[item["custom_id"]] = choices[0]["message"]["content"]
+    
+    for custom_id, task in pending.items():
+        combo, case_idx, _, idx, turns = task
+        lang, complexity, bucket = combo
+        output = outputs.get(custom_id)
+        if output is None:
+            yield task, None
+            continue
+        result, is_fallback = parse_dialogue(output, CASES[case_idx], turns, bucket, idx, complexity, lang, case_idx + 1)
+        if result is not None and not is_fallback:
+            cache_put(cache_keys[custom_id], output)
+        yield task, result
 
 # ===========================================
 # LOAD CASES
 # ===========================================
+CASE_HEADER_RE = re.compile(rb"\[case ")
+
+def iter_case_summaries(path):
+    """Yield case summaries (truncated to CASE_SUMMARY_MAX_CHARS) from the formatted case file.
+
+    Cases are separated by "[case N]" header lines. The file is memory-mapped and
+    scanned for headers with one regex pass, and only the bytes needed for the
+    truncated summary are decoded, so the full file is never held in memory as a string.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    # UTF-8 uses at most 4 bytes per character, so this many bytes always cover the summary
+    max_bytes = 4 * CASE_SUMMARY_MAX_CHARS + 1024
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        starts = [match.start() for match in CASE_HEADER_RE.finditer(mm)]
+        for start, end in zip(starts, starts[1:] + [len(mm)]):
+            # Split at first newline to separate case number from content
+            header_end = mm.find(b"\n", start, end)
+            if header_end != -1:
+                body_end = min(end, header_end + 1 + max_bytes)
+                case_content = mm[header_end + 1:body_end].decode("utf-8", errors="ignore").lstrip()
+                if body_end == end:
+                    case_content = case_content.rstrip()
+                # Only include cases with substantial content (at least 100 chars)
+                if len(case_content) > 100:
+                    yield case_content[:CASE_SUMMARY_MAX_CHARS]
+
 if not Path(CASE_SUMMARY_FILE).exists():
     raise FileNotFoundError(f"Case file not found: {CASE_SUMMARY_FILE}")
 
-with open(CASE_SUMMARY_FILE, "r", encoding="utf-8") as f:
-    content = f.read()
-
-# Parse cases from formatted file (cases are separated by [case N] headers)
-CASES = []
-for case_text in content.split("[case ")[1:]:  # Skip first empty part before [case 1]
-    if case_text.strip():
-        # Split at first newline to separate case number from content
-        lines = case_text.split("\n", 1)
-        if len(lines) > 1:
-            case_num = lines[0].split("]")[0]
-            case_content = lines[1].strip()
-            # Only include cases with substantial content (at least 100 chars)
-            if len(case_content) > 100:
-                CASES.append(case_content)
+# Parse cases from formatted file (cases are separated by [case N] headers).
+# Summaries are truncated once here; prompts only ever use the first CASE_SUMMARY_MAX_CHARS.
+CASES = list(iter_case_summaries(CASE_SUMMARY_FILE))
 
 print(f"Loaded {len(CASES)} case summaries from {CASE_SUMMARY_FILE}")
 sys.stdout.flush()
@@ -854,7 +1525,6 @@ sys.stdout.flush()
 # ===========================================
 # Create language-specific output file
 output_file = f"{OUTPUT_DIR}/{CURRENT_LANGUAGE}_posco_dataset.jsonl"
-dataset = []
 
 # Track distribution counts for each (language, complexity, bucket) combination
 # Only track the current language
@@ -871,22 +1541,40 @@ case_start, case_end = CASE_RANGES[CURRENT_LANGUAGE]
 # ===========================================
 # If the output file already exists and is non-empty, resume generation:
 # - Do NOT overwrite the file
-# - Recompute distribution counts from existing rows
-# - Continue numbering dialogue IDs from the next index
+# - Recompute distribution counts and collect the dialogue IDs of existing rows
+# - Skip planned dialogues whose IDs are already present (see GENERATION PLAN)
+def truncate_partial_line(path):
+    """Cut the file back to its last newline; returns the number of bytes removed.
+
+    Output is flushed in groups, so a killed run can leave a torn record at the end;
+    without this, the first record appended on resume would be glued onto it.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if mm[size - 1:] == b"\n":
+            return 0
+        keep = mm.rfind(b"\n") + 1  # 0 if there is no complete line at all
+    os.truncate(path, keep)
+    return size - keep
+
 resume_existing = Path(output_file).exists() and Path(output_file).stat().st_size > 0
+done_ids = set()
+max_idx_seen = 0
 if resume_existing:
-    existing_total = 0
-    max_case_id_seen = 0
     try:
-        with open(output_file, "r", encoding="utf-8") as rf:
+        torn_bytes = truncate_partial_line(output_file)
+        if torn_bytes:
+            print(f"Resume: dropped an incomplete last record ({torn_bytes} bytes) left by an interrupted run")
+            sys.stdout.flush()
+        # Raw bytes straight into json_loads (orjson when available), no per-line decoding
+        with open(output_file, "rb") as rf:
             for line in rf:
                 line = line.strip()
                 if not line:
                     continue
-                existing_total += 1
                 try:
-                    obj = json.loads(line)
-                except Exception:
+                    obj = json_loads(line)
+                except JSON_PARSE_ERRORS:
                     continue
                 comp = obj.get("complexity")
                 buck = obj.get("bucket")
@@ -894,19 +1582,76 @@ if resume_existing:
                     key = (CURRENT_LANGUAGE, comp, buck)
                     if key in distribution_counts:
                         distribution_counts[key] += 1
-                cid = obj.get("case_id")
-                if isinstance(cid, int) and cid > max_case_id_seen:
-                    max_case_id_seen = cid
-        # Continue from next case after the max case_id used (still within the configured range)
-        # Note: case_id is 1-indexed; case index is 0-indexed.
-        next_case_idx = max_case_id_seen  # if last used was N, next index is N (0-indexed)
-        if next_case_idx < case_start:
-            next_case_idx = case_start
-        case_indices[CURRENT_LANGUAGE] = next_case_idx
+                dialogue_id = obj.get("dialogue_id")
+                if isinstance(dialogue_id, str):
+                    done_ids.add(dialogue_id)
+                    idx_part = dialogue_id.rsplit("_", 1)[-1]
+                    if idx_part.isdigit():
+                        max_idx_seen = max(max_idx_seen, int(idx_part))
     except Exception as e:
         print(f"⚠ Resume read failed, starting fresh: {str(e)}")
         sys.stdout.flush()
         resume_existing = False
+        distribution_counts = {key: 0 for key in DISTRIBUTION_FILTERED.keys()}
+        done_ids = set()
+        max_idx_seen = 0
+
+# ===========================================
+# GENERATION PLAN
+# ===========================================
+# All random draws (case fallback, turn counts, ordering) are made up front, on this
+# private generator, so the whole run is described by PLAN and is reproducible with
+# GENERATION_SEED; worker threads only receive turn counts and never draw numbers.
+plan_rng = random.Random(GENERATION_SEED)
+
+def make_task(combo, dialogue_num, idx):
+    """Plan one dialogue as (combo, case_idx, dialogue_num, idx, turns)"""
+    # Pick a case index. If we hit the end of the language range, sample randomly within the range.
+    # This avoids getting stuck below TARGET_SAMPLES due to occasional generation/parsing failures.
+    case_idx = case_indices[CURRENT_LANGUAGE]
+    if case_idx >= case_end:
+        case_idx = plan_rng.randint(case_start, case_end - 1)
+    else:
+        case_indices[CURRENT_LANGUAGE] += 1
+    min_t, max_t = BUCKETS[combo[2]]
+    return (combo, case_idx, dialogue_num, idx, plan_rng.randint(min_t, max_t))
+
+def task_dialogue_id(task):
+    """Dialogue ID a planned task will be saved under"""
+    (lang, _, bucket), case_idx, _, idx, _ = task
+    return make_dialogue_id(lang, bucket, case_idx + 1, idx)
+
+total_generated = sum(distribution_counts.get((CURRENT_LANGUAGE, c, b), 0) 
+                      for c in COMPLEXITY_LEVELS for b in BUCKETS.keys())
+
+# The full plan is always built from the start of the case range, so with the same
+# GENERATION_SEED a resumed run reproduces the original dialogue IDs.
+PLAN = []
+next_dialogue_idx = 1
+for combo, target_count in DISTRIBUTION_FILTERED.items():
+    for dialogue_num in range(1, target_count + 1):
+        PLAN.append(make_task(combo, dialogue_num, next_dialogue_idx))
+        next_dialogue_idx += 1
+# Interleave complexities/buckets so long (bucket D) completions are not all left for the end
+plan_rng.shuffle(PLAN)
+
+if resume_existing:
+    # Skip dialogues already saved, then cap each combination at what is still missing
+    # (rows from re-planned retries or an earlier plan carry other IDs but still count).
+    remaining = {combo: target - distribution_counts[combo] for combo, target in DISTRIBUTION_FILTERED.items()}
+    planned_total = len(PLAN)
+    resumed_plan = []
+    for task in PLAN:
+        if task_dialogue_id(task) in done_ids or remaining[task[0]] <= 0:
+            continue
+        remaining[task[0]] -= 1
+        resumed_plan.append(task)
+    PLAN = resumed_plan
+    print(f"Resume: skipping {planned_total - len(PLAN)} already-complete dialogues; generating {len(PLAN)} new")
+    sys.stdout.flush()
+
+# Re-planned retries get fresh indices beyond anything already used
+next_dialogue_idx = max(next_dialogue_idx, max_idx_seen + 1)
 
 # Open file for incremental saving
 print("=" * 60)
@@ -916,93 +1661,148 @@ print(f"Starting generation loop. Target: {TARGET_SAMPLES} dialogues")
 print(f"Language: {CURRENT_LANGUAGE.capitalize()}")
 print(f"Case range: {case_start + 1}-{case_end} (cases {case_start + 1} to {case_end})")
 print(f"Output file: {output_file}")
+if GENERATION_MODE == "batch":
+    print(f"Mode: OpenAI Batch API (polling every {BATCH_POLL_SECONDS}s)")
+else:
+    print(f"Concurrent requests: {MAX_CONCURRENT_REQUESTS}")
+    if DIALOGUES_PER_CALL > 1:
+        print(f"Dialogues per call: {DIALOGUES_PER_CALL}")
 if resume_existing:
     existing_generated = sum(distribution_counts.get((CURRENT_LANGUAGE, c, b), 0) for c in COMPLEXITY_LEVELS for b in BUCKETS.keys())
     print(f"Resume: detected existing file with {existing_generated} dialogues. Will append until {TARGET_SAMPLES}.")
 print("=" * 60)
 sys.stdout.flush()
 
-file_mode = "a" if resume_existing else "w"
-with open(output_file, file_mode, encoding="utf-8") as f:
-    total_generated = sum(distribution_counts.get((CURRENT_LANGUAGE, c, b), 0) 
-                          for c in COMPLEXITY_LEVELS for b in BUCKETS.keys())
-    
-    # Generate dialogs following the distribution plan
-    # Iterate through all combinations and generate required number for each
-    while total_generated < TARGET_SAMPLES:
-        # Find next combination that needs more dialogs (only for current language)
-        next_combo = None
-        for (lang, complexity, bucket), target_count in DISTRIBUTION_FILTERED.items():
-            current_count = distribution_counts[(lang, complexity, bucket)]
-            if current_count < target_count:
-                next_combo = (lang, complexity, bucket)
-                break
-        
-        # If all combinations are complete, break
-        if next_combo is None:
-            break
-        
-        lang, complexity, bucket = next_combo
-        target_count = DISTRIBUTION_FILTERED[next_combo]
-        current_count = distribution_counts[next_combo]
-        
-        dialogue_num = current_count + 1
-
-        # Pick a case index. If we hit the end of the language range, sample randomly within the range.
-        # This avoids getting stuck below TARGET_SAMPLES due to occasional generation/parsing failures.
-        case_idx = case_indices[CURRENT_LANGUAGE]
-        if case_idx >= case_end:
-            case_idx = random.randint(case_start, case_end - 1)
-        else:
-            # Only advance the pointer after we pick a case to try.
-            case_indices[CURRENT_LANGUAGE] += 1
-
-        # Try a few times on the same case before moving on.
-        result = None
-        case_number = case_idx + 1  # 1-indexed case number
-        for attempt in range(3):
-            print(
-                f"Generating {CURRENT_LANGUAGE} {complexity} {bucket} ({dialogue_num}/{target_count}) "
-                f"[Case {case_number}] (Total: {total_generated + 1}/{TARGET_SAMPLES})..."
-                + (f" (retry {attempt + 1}/3)" if attempt > 0 else "")
-            )
+def generate_task(task):
+    """Generate one planned dialogue, trying the same case up to 3 times (runs in a worker thread)"""
+    combo, case_idx, dialogue_num, idx, turns = task
+    lang, complexity, bucket = combo
+    target_count = DISTRIBUTION_FILTERED[combo]
+    case_number = case_idx + 1  # 1-indexed case number
+    result = None
+    for attempt in range(3):
+        print(
+            f"Generating {lang} {complexity} {bucket} ({dialogue_num}/{target_count}) "
+            f"[Case {case_number}] (Dialogue #{idx})..."
+            + (f" (retry {attempt + 1}/3)" if attempt > 0 else "")
+        )
+        sys.stdout.flush()
+        try:
+            result = generate_dialogue(bucket, idx, complexity, lang, case_number, turns)
+        except Exception as e:
+            print(f"✗ Error generating dialogue: {str(e)}")
             sys.stdout.flush()
-            try:
-                case = CASES[case_idx]
-                result = generate_dialogue(case, bucket, total_generated + 1, complexity, CURRENT_LANGUAGE, case_number)
-            except Exception as e:
-                print(f"✗ Error generating dialogue: {str(e)}")
-                sys.stdout.flush()
-                result = None
-            if result:
-                break
-
+            result = None
         if result:
-            # Verify the fields match
-            result["language"] = CURRENT_LANGUAGE
-            result["complexity"] = complexity
-            result["bucket"] = bucket
-            result["case_id"] = case_number  # Store 1-indexed case ID
-            
-            dataset.append(result)
-            distribution_counts[next_combo] += 1
-            total_generated += 1
-            
-            # Save immediately to file (incremental saving)
-            f.write(json.dumps(result, ensure_ascii=False))
-            f.write("\n")
-            f.flush()  # Ensure data is written to disk immediately
-            print(f"✓ Generated and saved: {result['dialogue_id']} ({CURRENT_LANGUAGE}/{complexity}/{bucket})")
-            
-            # Print progress summary
-            lang_total = sum(distribution_counts.get((CURRENT_LANGUAGE, c, b), 0) 
-                           for c in COMPLEXITY_LEVELS for b in BUCKETS.keys())
-            print(f"  Progress - {CURRENT_LANGUAGE.capitalize()}: {lang_total}/{SAMPLES_PER_LANGUAGE} | "
-                  f"Overall: {total_generated}/{TARGET_SAMPLES}")
-            sys.stdout.flush()
+            break
+    return task, result
+
+def generate_task_group(group):
+    """Generate a group of planned dialogues with one call, retrying any it missed one by one"""
+    if len(group) == 1:
+        return [generate_task(group[0])]
+    (lang, complexity, _), _, _, _, _ = group[0]
+    print(f"Generating {len(group)} {lang} {complexity} dialogues in one call "
+          f"[Cases {', '.join(str(task[1] + 1) for task in group)}]...")
+    sys.stdout.flush()
+    try:
+        results = generate_dialogue_group(group)
+    except Exception as e:
+        print(f"✗ Error generating dialogues: {str(e)}")
+        sys.stdout.flush()
+        results = [None] * len(group)
+    return [(task, result) if result else generate_task(task) for task, result in zip(group, results)]
+
+def group_tasks(tasks):
+    """Split tasks into groups of up to DIALOGUES_PER_CALL sharing language and complexity (same system prompt)"""
+    if DIALOGUES_PER_CALL == 1:
+        return [[task] for task in tasks]
+    by_prompt = {}
+    for task in tasks:
+        by_prompt.setdefault(task[0][:2], []).append(task)
+    return [same_prompt[i:i + DIALOGUES_PER_CALL]
+            for same_prompt in by_prompt.values()
+            for i in range(0, len(same_prompt), DIALOGUES_PER_CALL)]
+
+def run_live(tasks, executor):
+    """Yield (task, result) as dialogues complete, keeping at most MAX_INFLIGHT calls submitted"""
+    pending = deque(group_tasks(tasks))
+    inflight = set()
+    while pending and len(inflight) < MAX_INFLIGHT:
+        inflight.add(executor.submit(generate_task_group, pending.popleft()))
+    while inflight:
+        done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+        for future in done:
+            # Refill the freed slot before handing the results back for writing
+            if pending:
+                inflight.add(executor.submit(generate_task_group, pending.popleft()))
+            yield from future.result()
+
+unflushed_results = 0
+
+def write_result(f, result):
+    """Append one dialogue as a single JSONL line.
+
+    Only the main thread writes: workers return results through run_live/run_batch.
+    Lines go through the file's write buffer and are flushed every JSONL_FLUSH_EVERY
+    dialogues (and at the end of each round), not with a syscall per dialogue.
+    """
+    global unflushed_results
+    f.write(json_dumps(result) + b"\n")
+    unflushed_results += 1
+    if unflushed_results >= JSONL_FLUSH_EVERY:
+        f.flush()
+        unflushed_results = 0
+
+# Binary mode: json_dumps already returns UTF-8 bytes, so lines are written without re-encoding
+file_mode = "ab" if resume_existing else "wb"
+with open(output_file, file_mode) as f, \
+        ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+    # Dispatch the plan concurrently; failed dialogs are re-planned (with the next case)
+    # and dispatched again in the following round.
+    tasks = PLAN
+    while tasks:
+        if GENERATION_MODE == "batch":
+            results = run_batch(tasks)
         else:
-            print(f"✗ Generation failed, will retry with next combination")
-            sys.stdout.flush()
+            # Handle results in completion order so each dialogue is saved as soon as it arrives,
+            # not held back behind slower (longer bucket) requests submitted earlier.
+            results = run_live(tasks, executor)
+        
+        failed = []
+        for task, result in results:
+            combo, case_idx = task[0], task[1]
+            lang, complexity, bucket = combo
+            if result:
+                # Verify the fields match
+                result["language"] = CURRENT_LANGUAGE
+                result["complexity"] = complexity
+                result["bucket"] = bucket
+                result["case_id"] = case_idx + 1  # Store 1-indexed case ID
+                
+                distribution_counts[combo] += 1
+                total_generated += 1
+                
+                # Save immediately to file (incremental saving)
+                write_result(f, result)
+                print(f"✓ Generated and saved: {result['dialogue_id']} ({CURRENT_LANGUAGE}/{complexity}/{bucket})")
+                
+                # Print progress summary
+                lang_total = sum(distribution_counts.get((CURRENT_LANGUAGE, c, b), 0) 
+                               for c in COMPLEXITY_LEVELS for b in BUCKETS.keys())
+                print(f"  Progress - {CURRENT_LANGUAGE.capitalize()}: {lang_total}/{SAMPLES_PER_LANGUAGE} | "
+                      f"Overall: {total_generated}/{TARGET_SAMPLES}")
+                sys.stdout.flush()
+            else:
+                failed.append(task)
+                print(f"✗ Generation failed for {CURRENT_LANGUAGE}/{complexity}/{bucket}, will retry in the next round")
+                sys.stdout.flush()
+        f.flush()  # Everything from this round is on disk before re-planning
+        
+        tasks = []
+        for combo, _, dialogue_num, _, _ in failed:
+            tasks.append(make_task(combo, dialogue_num, next_dialogue_idx))
+            next_dialogue_idx += 1
 
 print("=" * 60)
 print("DONE")
@@ -1019,5 +1819,9 @@ for complexity in COMPLEXITY_LEVELS:
         target = DISTRIBUTION_FILTERED.get((CURRENT_LANGUAGE, complexity, bucket), 0)
         status = "✓" if count == target else "✗"
         print(f"    {status} Bucket {bucket}: {count}/{target}")
+if usage_totals["prompt_tokens"]:
+    cached_pct = 100 * usage_totals["cached_tokens"] / usage_totals["prompt_tokens"]
+    print(f"\nPrompt cache: {usage_totals['cached_tokens']}/{usage_totals['prompt_tokens']} "
+          f"prompt tokens served from cache ({cached_pct:.1f}%)")
 print(f"\nSaved at: {output_file}")
 sys.stdout.flush()